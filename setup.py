@@ -30,4 +30,7 @@ setuptools.setup(
     install_requires=[
         'numpy'
     ],
+    extras_require={
+        'numba': ['numba']
+    },
 )
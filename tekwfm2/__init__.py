@@ -5,4 +5,4 @@ Created on Mon Mar  1 15:34:22 2021
 @author: Pavel Gostev
 """
 
-from .tekwfm import ScopeData
\ No newline at end of file
+from .tekwfm import ScopeData, read_wfm, read_wfm_raw, read_wfms
\ No newline at end of file
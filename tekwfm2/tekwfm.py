@@ -20,128 +20,332 @@ Tested on Python 3.6+
 """
 
 
+import os
 import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+# curve blocks larger than this are memory mapped instead of read at once
+MMAP_THRESHOLD = 128 * 2**20
+# number of decoded headers kept for repeated reads
+HEADER_CACHE_SIZE = 128
+
 
 class WfmReadError(Exception):
     """error for unexpected things"""
     pass
 
 
-def read_wfm(path):
-    """return sample data from path WFM file"""
+def read_wfm(path, use_mmap=False, dtype=np.float32):
+    """
+    return sample data from path WFM file
+
+    The curve block is read with a single call unless use_mmap is set
+    or it is larger than MMAP_THRESHOLD bytes.
+    Samples are scaled to dtype, float32 covers the 8-16 bit resolution
+    of the scope; pass np.float64 for double precision.
+    """
+    bin_wave, meta = read_wfm_raw(path, use_mmap)
+    scaled_array = _scale(bin_wave, meta['vscale'], meta['voffset'], dtype)
+    return scaled_array, meta
+
+
+def read_wfms(paths, workers=None, dtype=np.float32):
+    """
+    return a list of read_wfm results for paths, read in parallel threads
+
+    File reads and numpy/numba scaling release the GIL, so files overlap.
+    workers is the thread count, None for the ThreadPoolExecutor default.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(lambda path: read_wfm(path, dtype=dtype), paths))
+
+
+def read_wfm_raw(path, use_mmap=False):
+    """
+    return unscaled sample data and metadata from path WFM file
+
+    Samples read at once are in native byte order, memory mapped ones
+    keep the byte order of the file; volts are
+    samples * meta['vscale'] + meta['voffset'].
+    """
     with open(path, 'rb') as f:
-        hbytes = f.read(838)
-        meta = decode_header(path, hbytes)
-
-        # file signature checks
-        if meta['imp_dim_count'] != 1:
-            raise WfmReadError(path, 'imp dim count not 1')
-        if meta['exp_dim_count'] != 1:
-            raise WfmReadError(path, 'exp dim count not 1')
-        if meta['record_type'] != 2:
-            raise WfmReadError(path, 'not WFMDATA_VECTOR')
-        # if meta['exp_dim_1_type'] != 0:
-        #    raise WfmReadError(path, 'not EXPLICIT_SAMPLE')
-        if meta['time_base_1'] != 0:
-            raise WfmReadError(path, 'not BASE_TIME')
-        if meta['fastframe']:
-            raise WfmReadError(path, 'Fast Frames are not supported')
+        meta = _read_header(path, f)
         # read curve block
-        bin_wave = np.memmap(filename=f,
-                             dtype=meta['dformat'],
-                             mode='r',
-                             offset=meta['curve_offset'],
-                             shape=(meta['dlen']),
-                             order='F')
-
-    scaled_array = bin_wave * meta['vscale'] + meta['voffset']
-    return scaled_array, meta
+        if use_mmap or meta['dsize'] > MMAP_THRESHOLD:
+            bin_wave = np.memmap(filename=f,
+                                 dtype=meta['dformat'],
+                                 mode='r',
+                                 offset=meta['curve_offset'],
+                                 shape=(meta['dlen'],))
+        else:
+            f.seek(meta['curve_offset'])
+            bin_wave = np.fromfile(f, dtype=meta['dformat'],
+                                   count=meta['dlen'])
+            if bin_wave.size != meta['dlen']:
+                raise WfmReadError(path, 'curve block truncated')
+            # swap big-endian samples once so scaling runs on native data
+            if not bin_wave.dtype.isnative:
+                bin_wave.byteswap(inplace=True)
+                bin_wave = bin_wave.view(bin_wave.dtype.newbyteorder('='))
+    return bin_wave, meta
+
+
+_header_cache = OrderedDict()
+_header_cache_lock = threading.Lock()
+
+
+def _read_header(path, f):
+    """
+    return checked metadata of path WFM file open as f
+
+    Results are cached by real path, device, inode, mtime and size,
+    so a moved in or rewritten file is decoded again.
+    """
+    st = os.fstat(f.fileno())
+    key = (os.path.realpath(path), st.st_dev, st.st_ino,
+           st.st_mtime_ns, st.st_size)
+    with _header_cache_lock:
+        meta = _header_cache.get(key)
+        if meta is not None:
+            _header_cache.move_to_end(key)
+            return dict(meta)
+
+    meta = _check_header(path, decode_header(path, f.read(838)))
+    with _header_cache_lock:
+        _header_cache[key] = meta
+        while len(_header_cache) > HEADER_CACHE_SIZE:
+            _header_cache.popitem(last=False)
+    return dict(meta)
+
+
+def _check_header(path, meta):
+    """return meta if the file signature is supported"""
+    # file signature checks
+    if meta['imp_dim_count'] != 1:
+        raise WfmReadError(path, 'imp dim count not 1')
+    if meta['exp_dim_count'] != 1:
+        raise WfmReadError(path, 'exp dim count not 1')
+    if meta['record_type'] != 2:
+        raise WfmReadError(path, 'not WFMDATA_VECTOR')
+    # if meta['exp_dim_1_type'] != 0:
+    #    raise WfmReadError(path, 'not EXPLICIT_SAMPLE')
+    if meta['time_base_1'] != 0:
+        raise WfmReadError(path, 'not BASE_TIME')
+    if meta['fastframe']:
+        raise WfmReadError(path, 'Fast Frames are not supported')
+    return meta
+
+
+def _scale(bin_wave, vscale, voffset, dtype=np.float32):
+    """return bin_wave * vscale + voffset as dtype without temporary arrays"""
+    out = np.empty(bin_wave.shape, dtype=dtype)
+    vscale = out.dtype.type(vscale)
+    voffset = out.dtype.type(voffset)
+    # numba takes native byte order only, numpy swaps memmaps in chunks
+    if _scale_kernel is not None and bin_wave.dtype.isnative:
+        _scale_kernel(bin_wave, vscale, voffset, out)
+        return out
+    np.multiply(bin_wave, vscale, out=out)
+    np.add(out, voffset, out=out)
+    return out
+
+
+class LazyScaled(np.lib.mixins.NDArrayOperatorsMixin):
+    """
+    Scaled samples raw * vscale + voffset, computed on access
+
+    Indexing scales only the selected samples. Conversion to an array,
+    ndarray methods and attributes, numpy ufuncs and operators scale
+    the whole record once and keep it for later calls; in-place
+    operations and item assignment write to that array.
+    """
+
+    def __init__(self, raw, vscale, voffset, dtype=np.float32):
+        self.dtype = np.dtype(dtype)
+        self._raw = raw
+        self._s = self.dtype.type(vscale)
+        self._o = self.dtype.type(voffset)
+        self._array = None
+
+    def __len__(self):
+        return len(self._raw)
+
+    @property
+    def shape(self):
+        return self._raw.shape
+
+    @property
+    def size(self):
+        return self._raw.size
+
+    @property
+    def ndim(self):
+        return self._raw.ndim
+
+    def _materialize(self):
+        """return the whole scaled record, scaling it on first call"""
+        if self._array is None:
+            self._array = _scale(self._raw, self._s, self._o, self.dtype)
+        return self._array
+
+    def __getattr__(self, name):
+        # only called for missing attributes, forward the ndarray ones
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._materialize(), name)
+
+    def __getitem__(self, key):
+        if self._array is not None:
+            return self._array[key]
+        part = self._raw[key]
+        if isinstance(part, np.ndarray):
+            return _scale(part, self._s, self._o, self.dtype)
+        return self.dtype.type(part) * self._s + self._o
+
+    def __setitem__(self, key, value):
+        self._materialize()[key] = value
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __array__(self, dtype=None, copy=None):
+        out = self._materialize()
+        if dtype is not None and out.dtype != dtype:
+            return out.astype(dtype)
+        return out.copy() if copy else out
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        out = kwargs.get('out', ())
+        if out:
+            kwargs['out'] = tuple(
+                x._materialize() if isinstance(x, LazyScaled) else x
+                for x in out)
+        inputs = tuple(x._materialize() if isinstance(x, LazyScaled) else x
+                       for x in inputs)
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        # in-place operators rebind the name to the returned object
+        if len(out) == 1 and isinstance(out[0], LazyScaled):
+            return out[0]
+        return result
+
+
+if njit is not None:
+    @njit(nogil=True, cache=True)
+    def _scale_kernel(x, s, o, out):
+        """numba kernel for out = x * s + o, specialized per sample dtype"""
+        for i in range(x.shape[0]):
+            out[i] = x[i] * s + o
+else:
+    _scale_kernel = None
+
+
+# header fields as (name, struct format, offset in v2 header, shifted in v1)
+# v1 headers are 2 bytes shorter before the shifted fields
+_HEADER_FIELDS = (
+    ('bps', 'b', 15, False),  # bytes-per-sample
+    ('curve_offset', 'i', 16, False),  # 838 + ((frames - 1) * 54)
+    ('Frames', 'I', 72, False),
+    ('fastframe', 'I', 78, False),
+    ('imp_dim_count', 'I', 114, False),
+    ('exp_dim_count', 'I', 118, False),
+    ('record_type', 'I', 122, False),
+    ('summary_frame', 'h', 154, False),
+    # scaling factors
+    ('vscale', 'd', 168, True),
+    ('voffset', 'd', 176, True),
+    # sample data type detection
+    ('code', 'i', 240, True),
+    ('exp_dim_1_type', 'I', 244, True),
+    ('tstart', 'd', 488, True),
+    ('tscale', 'd', 536, True),
+    ('time_base_1', 'I', 768, True),
+    # trigger detail, frame index 0
+    ('tfrac', 'd', 788, True),
+    ('tdatefrac', 'd', 796, True),
+    ('tdate', 'I', 804, True),
+    # data offsets
+    # frames are same size, only first frame offsets are used
+    ('dsize', 'I', 818, True),
+)
+_HEADER_NAMES = tuple(field[0] for field in _HEADER_FIELDS)
+
+
+def _header_struct(endianness, v1_offset):
+    """build a struct that unpacks all header fields at once"""
+    fmt = endianness
+    pos = 0
+    for _, code, offset, shifted in _HEADER_FIELDS:
+        if shifted:
+            offset -= v1_offset
+        fmt += '%dx%s' % (offset - pos, code)
+        pos = offset + struct.calcsize(endianness + code)
+    return struct.Struct(fmt)
+
+
+# version strings at offset 2 as little-endian integers
+_WFM_V1 = int.from_bytes(b':WFM#001', 'little')
+_WFM_V2 = int.from_bytes(b':WFM#002', 'little')
+_HEADER_STRUCTS = {
+    (endianness, v1_offset): _header_struct(endianness, v1_offset)
+    for endianness in '<>' for v1_offset in (0, 2)}
+# sample formats keyed by (endianness, data type code, bytes-per-sample)
+_SAMPLE_FORMATS = {
+    (endianness, code, bps): endianness + fmt
+    for endianness in '<>'
+    for code, bps, fmt in ((7, 1, 'i1'), (0, 2, 'i2'), (4, 4, 'f4'))}
 
 
 def decode_header(path, header_bytes):
     """returns a dict of wfm metadata"""
-    wfm_info = {}
     if len(header_bytes) != 838:
         raise WfmReadError(path, 'wfm header bytes not 838')
-    wfm_info['byte_order'] = struct.unpack_from('H', header_bytes, offset=0)[0]
+    byte_order = int.from_bytes(header_bytes[0:2], 'little')
+    version = bytes(header_bytes[2:10])
 
-    if wfm_info['byte_order'] == 0x0f0f:
+    if byte_order == 0x0f0f:
         endianness = "<"
-    elif wfm_info['byte_order'] == 0xf0f0:
+    elif byte_order == 0xf0f0:
         endianness = ">"
     else:
         raise WfmReadError(path, 'endianness could not be parsed')
 
-    wfm_info['version'] = struct.unpack_from('8s', header_bytes, offset=2)[0]
-
-    if wfm_info['version']==b':WFM#001':
-        v1_offset = 2
-    elif wfm_info['version']==b':WFM#002':
+    magic = int.from_bytes(version, 'little')
+    if magic == _WFM_V2:
         v1_offset = 0
+    elif magic == _WFM_V1:
+        v1_offset = 2
     else:
         raise WfmReadError(
              path, 'only version 1 or 2 wfms supported in this version')
 
-    wfm_info['imp_dim_count'] = struct.unpack_from(
-        endianness+'I', header_bytes, offset=114)[0]
-    wfm_info['exp_dim_count'] = struct.unpack_from(
-        endianness+'I', header_bytes, offset=118)[0]
-    wfm_info['record_type'] = struct.unpack_from(
-        endianness+'I', header_bytes, offset=122)[0]
-    wfm_info['exp_dim_1_type'] = struct.unpack_from(
-        endianness+'I', header_bytes, offset=244-v1_offset)[0]
-    wfm_info['time_base_1'] = struct.unpack_from(
-        endianness+'I', header_bytes, offset=768-v1_offset)[0]
-    wfm_info['fastframe'] = struct.unpack_from(endianness+'I', header_bytes, offset=78)[0]
-    wfm_info['Frames'] = struct.unpack_from(
-        endianness+'I', header_bytes, offset=72)[0] + 1
-    wfm_info['summary_frame'] = struct.unpack_from(
-        endianness+'h', header_bytes, offset=154)[0]
-    wfm_info['curve_offset'] = struct.unpack_from(endianness+'i', header_bytes, offset=16)[
-        0]  # 838 + ((frames - 1) * 54)
-    # scaling factors
-    wfm_info['vscale'] = struct.unpack_from(endianness+'d', header_bytes, offset=168-v1_offset)[0]
-    wfm_info['voffset'] = struct.unpack_from(endianness+'d', header_bytes, offset=176-v1_offset)[0]
-    #wfm_info['tstart'] = struct.unpack_from('d', header_bytes, offset=496)[0]
-    wfm_info['tstart'] = struct.unpack_from(endianness+'d', header_bytes, offset=488-v1_offset)[0]
-    wfm_info['tscale'] = struct.unpack_from(endianness+'d', header_bytes, offset=536-v1_offset)[0]
-    # trigger detail
-    wfm_info['tfrac'] = struct.unpack_from(endianness+'d', header_bytes, offset=788-v1_offset)[
-        0]  # frame index 0
-    wfm_info['tdatefrac'] = struct.unpack_from(
-        endianness+'d', header_bytes, offset=796)[0]  # frame index 0
-    wfm_info['tdate'] = struct.unpack_from(endianness+'I', header_bytes, offset=804-v1_offset)[
-        0]  # frame index 0
+    wfm_info = {'byte_order': byte_order, 'version': version}
+    values = _HEADER_STRUCTS[endianness, v1_offset].unpack_from(header_bytes, 0)
+    wfm_info.update(zip(_HEADER_NAMES, values))
+    wfm_info['Frames'] += 1
 
-    # data offsets
-    # frames are same size, only first frame offsets are used
-    dsize = struct.unpack_from(endianness+'I', header_bytes, offset=818-v1_offset)[0]
-    wfm_info['dsize'] = dsize
-    # sample data type detection
-    code = struct.unpack_from(endianness+'i', header_bytes, offset=240-v1_offset)[0]
-    wfm_info['code'] = code
-    bps = struct.unpack_from(endianness+'b', header_bytes, offset=15)[
-        0]  # bytes-per-sample
-    wfm_info['bps'] = bps
-    if code == 7 and bps == 1:
-        dformat = endianness+'i1'
-    elif code == 0 and bps == 2:
-        dformat = endianness+'i2'
-    elif code == 4 and bps == 4:
-        dformat = endianness+'f32'
-    else:
+    bps = wfm_info['bps']
+    try:
+        dformat = _SAMPLE_FORMATS[endianness, wfm_info['code'], bps]
+    except KeyError:
         raise WfmReadError(
             path, 'data type code or bytes-per-sample not understood')
     wfm_info['dformat'] = dformat
-    wfm_info['dlen'] = dsize // bps
+    wfm_info['dlen'] = wfm_info['dsize'] // bps
     return wfm_info
 
 
 class ScopeData:
 
-    def __init__(self, path):
+    def __init__(self, path, dtype=np.float32):
         """
         Class for WFM oscillogram data from old Tek Oscilloscopes
         5 Series MSO
@@ -151,17 +355,32 @@ class ScopeData:
         ----------
         path : str
             Full or relative path to oscillogram WFM file.
+        dtype : numpy dtype, optional
+            Type of scaled samples in y. The default is np.float32.
+
+        Samples in y are scaled on access, see LazyScaled;
+        use np.asarray(y) to get the whole record as an array.
+        Unscaled samples are available as y_raw.
 
         """
         try:
-            self.y, meta = read_wfm(path)
+            bin_wave, meta = read_wfm_raw(path)
         except Exception as E:
             raise WfmReadError(path, E)
+        self.y_raw = bin_wave
+        self.y = LazyScaled(bin_wave, meta['vscale'], meta['voffset'], dtype)
 
         for k, v in meta.items():
             setattr(self, k, v)
 
         samples = len(self.y)
         self.tstop = samples * self.tscale + self.tstart
-        self.x = np.linspace(self.tstart, self.tstop, samples, endpoint=False)
-        self.horizInterval = self.x[1] - self.x[0]
+        self.horizInterval = self.tscale
+        self._x = None
+
+    @property
+    def x(self):
+        """time axis, built on first access"""
+        if self._x is None:
+            self._x = self.tstart + np.arange(len(self.y)) * self.tscale
+        return self._x
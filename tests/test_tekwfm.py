@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for WFM header decoding and sample scaling
+on synthetic v1 & v2, little- and big-endian files
+"""
+
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from tekwfm2 import tekwfm
+from tekwfm2.tekwfm import (
+    ScopeData, WfmReadError, decode_header, read_wfm, read_wfm_raw, read_wfms)
+
+# (name, struct format, offset in v2 header, shifted in v1, value)
+FIELDS = (
+    ('bps', 'b', 15, False, None),
+    ('curve_offset', 'i', 16, False, 838),
+    ('Frames', 'I', 72, False, 0),
+    ('fastframe', 'I', 78, False, 0),
+    ('imp_dim_count', 'I', 114, False, 1),
+    ('exp_dim_count', 'I', 118, False, 1),
+    ('record_type', 'I', 122, False, 2),
+    ('summary_frame', 'h', 154, False, -3),
+    ('vscale', 'd', 168, True, 0.0125),
+    ('voffset', 'd', 176, True, -0.375),
+    ('code', 'i', 240, True, None),
+    ('exp_dim_1_type', 'I', 244, True, 5),
+    ('tstart', 'd', 488, True, -2.5e-6),
+    ('tscale', 'd', 536, True, 4e-10),
+    ('time_base_1', 'I', 768, True, 0),
+    ('tfrac', 'd', 788, True, 0.25),
+    ('tdatefrac', 'd', 796, True, 0.75),
+    ('tdate', 'I', 804, True, 1614602062),
+    ('dsize', 'I', 818, True, None),
+)
+# (data type code, bytes-per-sample, numpy format)
+SAMPLE_TYPES = ((7, 1, 'i1'), (0, 2, 'i2'), (4, 4, 'f4'))
+DLEN = 1000
+
+
+def make_header(endianness, v1_offset, code, bps, **overrides):
+    header = bytearray(838)
+    mark = 0x0f0f if endianness == '<' else 0xf0f0
+    struct.pack_into(endianness + 'H', header, 0, mark)
+    header[2:10] = b':WFM#001' if v1_offset else b':WFM#002'
+    values = {'bps': bps, 'code': code, 'dsize': DLEN * bps}
+    values.update(overrides)
+    for name, fmt, offset, shifted, value in FIELDS:
+        if shifted:
+            offset -= v1_offset
+        struct.pack_into(endianness + fmt, header, offset,
+                         values.get(name, value))
+    return bytes(header)
+
+
+def reference_header(header, endianness, v1_offset):
+    """decode every field with its own unpack call, as the manual lists them"""
+    meta = {}
+    for name, fmt, offset, shifted, _ in FIELDS:
+        if shifted:
+            offset -= v1_offset
+        meta[name] = struct.unpack_from(endianness + fmt, header, offset)[0]
+    meta['Frames'] += 1
+    return meta
+
+
+@pytest.fixture(params=[(e, v, t) for e in '<>' for v in (0, 2)
+                        for t in SAMPLE_TYPES],
+                ids=lambda p: '%s-v%d-%s' % (p[0], 2 - p[1] // 2, p[2][2]))
+def wfm(request, tmp_path):
+    endianness, v1_offset, (code, bps, fmt) = request.param
+    header = make_header(endianness, v1_offset, code, bps)
+    raw = (np.arange(DLEN) % 200 - 100).astype(endianness + fmt)
+    path = tmp_path / 'test.wfm'
+    path.write_bytes(header + raw.tobytes())
+    return str(path), header, endianness, v1_offset, fmt, raw
+
+
+def test_decode_header(wfm):
+    path, header, endianness, v1_offset, _, _ = wfm
+    meta = decode_header(path, header)
+    for name, value in reference_header(header, endianness, v1_offset).items():
+        assert meta[name] == value, name
+    assert meta['dlen'] == DLEN
+
+
+def test_read_wfm(wfm):
+    path, header, _, _, _, raw = wfm
+    meta = decode_header(path, header)
+    expected = raw.astype(np.float64) * meta['vscale'] + meta['voffset']
+    y, _ = read_wfm(path)
+    np.testing.assert_allclose(y, expected, rtol=1e-6, atol=1e-6)
+
+
+def test_read_wfm_raw(wfm):
+    path, _, _, _, _, raw = wfm
+    bin_wave, _ = read_wfm_raw(path)
+    assert bin_wave.dtype.isnative
+    np.testing.assert_array_equal(bin_wave, raw)
+    # memory mapped samples are not loaded to swap their byte order
+    bin_wave, _ = read_wfm_raw(path, use_mmap=True)
+    assert isinstance(bin_wave, np.memmap)
+    assert bin_wave.dtype == raw.dtype
+    np.testing.assert_array_equal(bin_wave, raw)
+
+
+def test_truncated_curve(tmp_path):
+    header = make_header('<', 0, 0, 2)
+    raw = np.zeros(DLEN - 50, dtype='<i2')
+    path = tmp_path / 'truncated.wfm'
+    path.write_bytes(header + raw.tobytes())
+    for use_mmap in (False, True):
+        with pytest.raises((WfmReadError, ValueError)):
+            read_wfm(str(path), use_mmap=use_mmap)
+
+
+def test_scope_data_indexing(wfm):
+    path = wfm[0]
+    scope = ScopeData(path)
+    y = np.asarray(ScopeData(path).y)
+    values = [scope.y[i] for i in range(len(y))]
+    assert values == list(y)
+    assert all(type(v) is np.float32 for v in values)
+    np.testing.assert_array_equal(scope.y[100:200], y[100:200])
+    np.testing.assert_array_equal(scope.y[::7], y[::7])
+    assert scope.y[-1] == y[-1]
+    assert list(scope.y) == list(y)
+
+
+def test_scope_data_array_api(wfm):
+    path = wfm[0]
+    scope = ScopeData(path)
+    y, _ = read_wfm(path)
+    assert scope.y.size == y.size and scope.y.ndim == 1
+    for name in ('min', 'max', 'mean', 'std', 'sum', 'argmax', 'tolist'):
+        assert getattr(scope.y, name)() == getattr(y, name)(), name
+    assert scope.y.astype(np.float64).dtype == np.float64
+    np.testing.assert_array_equal(scope.y + scope.y, y + y)
+    # the whole record is scaled once and reused
+    assert np.asarray(scope.y) is np.asarray(scope.y)
+    copy = scope.y.copy()
+    copy[0] += 1
+    assert scope.y[0] == y[0]
+
+
+def test_scope_data_inplace(wfm):
+    scope = ScopeData(wfm[0])
+    y = np.asarray(ScopeData(wfm[0]).y)
+    lazy = scope.y
+    scope.y += 1
+    assert scope.y is lazy
+    np.testing.assert_array_equal(scope.y, y + 1)
+    scope.y[0] = 7
+    assert scope.y[0] == 7
+
+
+def write_wfm(path, vscale, mtime_ns):
+    header = make_header('<', 0, 0, 2, vscale=vscale)
+    path.write_bytes(header + np.ones(DLEN, dtype='<i2').tobytes())
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+def test_header_cache(tmp_path, monkeypatch):
+    calls = []
+    decode = tekwfm.decode_header
+    monkeypatch.setattr(tekwfm, 'decode_header',
+                        lambda *args: calls.append(args) or decode(*args))
+    path = tmp_path / 'cached.wfm'
+    write_wfm(path, 0.5, 10**18)
+    assert read_wfm_raw(str(path))[1]['vscale'] == 0.5
+    assert read_wfm_raw(str(path))[1]['vscale'] == 0.5
+    assert len(calls) == 1
+    # rewritten file
+    write_wfm(path, 2.0, 2 * 10**18)
+    assert read_wfm_raw(str(path))[1]['vscale'] == 2.0
+    assert len(calls) == 2
+
+
+def test_header_cache_same_name(tmp_path, monkeypatch):
+    # same relative name, size and mtime in two directories
+    for name, vscale in (('d1', 0.0125), ('d2', 99.0)):
+        (tmp_path / name).mkdir()
+        write_wfm(tmp_path / name / 'a.wfm', vscale, 10**18)
+    for name, vscale in (('d1', 0.0125), ('d2', 99.0)):
+        monkeypatch.chdir(tmp_path / name)
+        assert read_wfm_raw('a.wfm')[1]['vscale'] == vscale
+
+
+def test_read_wfms(tmp_path):
+    paths = []
+    for i, (endianness, (code, bps, fmt)) in enumerate(
+            (e, t) for e in '<>' for t in SAMPLE_TYPES):
+        header = make_header(endianness, 0, code, bps, vscale=0.01 * (i + 1))
+        raw = (np.arange(DLEN) % 200 - 100).astype(endianness + fmt)
+        path = tmp_path / ('%d.wfm' % i)
+        path.write_bytes(header + raw.tobytes())
+        paths.append(str(path))
+    for dtype in (np.float32, np.float64):
+        results = read_wfms(paths, workers=4, dtype=dtype)
+        assert len(results) == len(paths)
+        for path, (y, meta) in zip(paths, results):
+            expected, expected_meta = read_wfm(path, dtype=dtype)
+            assert y.dtype == dtype
+            np.testing.assert_array_equal(y, expected)
+            assert meta == expected_meta
+
+
+def test_decode_header_buffer_types():
+    header = make_header('<', 0, 0, 2)
+    for buf in (header, bytearray(header), memoryview(header)):
+        meta = decode_header('test.wfm', buf)
+        assert meta['byte_order'] == 0x0f0f
+        assert type(meta['version']) is bytes
+        assert meta['version'] == b':WFM#002'
+
+
+def test_sample_formats(wfm):
+    path, header, endianness, _, fmt, raw = wfm
+    meta = decode_header(path, header)
+    assert type(meta['dformat']) is str
+    assert meta['dformat'] == endianness + fmt
+    bin_wave, _ = read_wfm_raw(path)
+    assert bin_wave.dtype == np.dtype(fmt)
+    np.testing.assert_array_equal(bin_wave, raw)
+
+
+def test_read_wfm_dtype(wfm):
+    path, header, _, _, _, raw = wfm
+    meta = decode_header(path, header)
+    y, _ = read_wfm(path)
+    assert y.dtype == np.float32
+    expected = (raw.astype(np.float32) * np.float32(meta['vscale'])
+                + np.float32(meta['voffset']))
+    np.testing.assert_array_equal(y, expected)
+    y, _ = read_wfm(path, dtype=np.float64)
+    assert y.dtype == np.float64
+    expected = raw.astype(np.float64) * meta['vscale'] + meta['voffset']
+    np.testing.assert_array_equal(y, expected)
+
+
+def test_read_wfm_mmap(wfm):
+    path = wfm[0]
+    y, meta = read_wfm(path)
+    y_mmap, meta_mmap = read_wfm(path, use_mmap=True)
+    np.testing.assert_array_equal(y_mmap, y)
+    assert meta_mmap == meta
+
+
+def test_scope_data_time_axis(wfm):
+    scope = ScopeData(wfm[0])
+    expected = np.linspace(scope.tstart, scope.tstop, DLEN, endpoint=False)
+    np.testing.assert_allclose(scope.x, expected, rtol=0,
+                               atol=1e-6 * scope.tscale)
+    assert scope.x is scope.x
+    assert scope.horizInterval == scope.tscale